@@ -1,216 +1,437 @@
 import asyncio
+import functools
+import heapq
+import json
+import logging
+import math
 import os
 import random
 import time
+import urllib.parse
+import uuid
+from contextlib import asynccontextmanager
 from typing import Literal
 
 import httpx
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from opentelemetry import trace
+from opentelemetry import context, trace
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.exporter.otlp.proto.http import Compression
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.trace import Status, StatusCode
 
 SERVICE_NAME = os.getenv("SERVICE_NAME", "synthetic-agent-app")
 OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
 TOOL_BASE = os.getenv("TOOL_BASE", "http://localhost:8081")
+# Talk HTTP/2 (prior knowledge over cleartext) to the tool service so concurrent
+# tool calls multiplex over a few connections. Set to 0 for HTTP/1.1-only servers.
+TOOL_HTTP2 = os.getenv("TOOL_HTTP2", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def _otlp_compression() -> Compression:
+    # Same lookup order as the exporter (traces-specific variable first), but
+    # gzip unless explicitly overridden (gzip|deflate|none); span batches
+    # compress well. A bad value only costs compression, never the app boot.
+    for var in ("OTEL_EXPORTER_OTLP_TRACES_COMPRESSION", "OTEL_EXPORTER_OTLP_COMPRESSION"):
+        raw = os.getenv(var, "").strip().lower()
+        if raw:
+            break
+    else:
+        return Compression.Gzip
+    try:
+        return Compression(raw)
+    except ValueError:
+        logger.warning("Unknown %s=%r; using gzip", var, raw)
+        return Compression.Gzip
+
+
+OTLP_COMPRESSION = _otlp_compression()
 
 resource = Resource.create({"service.name": SERVICE_NAME})
 provider = TracerProvider(resource=resource)
-processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{OTLP_ENDPOINT}/v1/traces"))
+processor = BatchSpanProcessor(
+    OTLPSpanExporter(endpoint=f"{OTLP_ENDPOINT}/v1/traces", compression=OTLP_COMPRESSION),
+    max_queue_size=4096,
+    max_export_batch_size=512,
+    schedule_delay_millis=2000,
+)
 provider.add_span_processor(processor)
 trace.set_tracer_provider(provider)
 tracer = trace.get_tracer(__name__)
 
-app = FastAPI()
+# Shared client so every tool call reuses keep-alive connections to TOOL_BASE.
+CLIENT: httpx.AsyncClient | None = None
 
+# Pending human waits, keyed by id; polled through /resume/{id}. Finished
+# entries are kept for _HUMAN_RESULT_TTL_S so clients have time to poll.
+# New waits arrive on _HUMAN_QUEUE; the scheduler keeps them in the
+# _HUMAN_WAITS heap, ordered by loop-clock resume time.
+_HUMAN_RESULT_TTL_S = 300.0
+_PENDING_HUMANS: dict[str, dict] = {}
+_HUMAN_QUEUE: asyncio.Queue | None = None
+_HUMAN_WAITS: list[tuple] = []
+_RESUME_TASKS: set[asyncio.Task] = set()
 
-def _attrs(agent_id: str, kind: str, **extra):
-    # If AGENT_NAME is set, namespace all agents to allow running multiple distinct meshes
-    prefix = os.getenv("AGENT_NAME")
-    if prefix:
-        agent_id = f"{prefix}:{agent_id}"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global CLIENT, _HUMAN_QUEUE
+    CLIENT = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=500, max_keepalive_connections=200, keepalive_expiry=300),
+        timeout=httpx.Timeout(30.0),
+        http1=not TOOL_HTTP2,
+        http2=TOOL_HTTP2,
+    )
+    _HUMAN_QUEUE = asyncio.Queue()
+    scheduler = asyncio.create_task(_human_scheduler())
+    try:
+        yield
+    finally:
+        # Stop the scheduler and any in-flight resumes while CLIENT still exists
+        await _stop_human_scheduler(scheduler)
+        await CLIENT.aclose()
+        CLIENT = None
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Private RNG (seeded from os.urandom) for simulated thinking time, early exits and jitter
+_rng = random.Random()
+
+# If AGENT_NAME is set, namespace all agents to allow running multiple distinct meshes.
+# Resolved once at import; _attrs runs for every span.
+_AGENT_PREFIX = os.getenv("AGENT_NAME")
+
+
+def _attrs(agent_id: str, kind: str, **extra):
     # Keep these stable; ATI can rely on them.
-    base = {
-        "ati.agent.id": agent_id,
+    return {
+        "ati.agent.id": f"{_AGENT_PREFIX}:{agent_id}" if _AGENT_PREFIX else agent_id,
         "ati.span.kind": kind,  # planner|worker|tool_call|checkpoint|token_stream
         "ati.workflow": "demo",
+        **extra,
     }
-    base.update(extra)
-    return base
-
-async def call_tool(client: httpx.AsyncClient, tool: str, delay_ms: int, error_rate: float, attempt: int, stream: bool = False, payload_size_kb: int = 0):
-    with tracer.start_as_current_span("tool_call", attributes=_attrs(
-        agent_id=f"worker:{tool}",
-        kind="tool_call",
-        **{
-            "ati.tool.name": tool,
-            "ati.retry.attempt": attempt,
-            "ati.tool.delay_ms": delay_ms,
-            "ati.tool.error_rate": error_rate,
-            "ati.tool.stream": int(stream),
-            "ati.tool.payload_kb": payload_size_kb,
-        }
-    )):
-        params = {"delay_ms": delay_ms, "error_rate": error_rate, "payload_size_kb": payload_size_kb}
-        if stream:
-            params["stream"] = 1
-            r = await client.get(f"{TOOL_BASE}/tool/{tool}", params=params, timeout=30.0)
+
+def _safe_attr(value, limit: int = 4096):
+    # Span attributes must be primitives, and huge strings get serialized by the
+    # exporter on every flush: stringify containers and cap the UTF-8 size.
+    if isinstance(value, (dict, list, tuple)):
+        value = json.dumps(value, default=str)
+    if isinstance(value, str) and len(value) > limit // 4:
+        raw = value.encode()
+        if len(raw) > limit:
+            return raw[:limit].decode(errors="ignore") + "...[truncated]"
+    return value
+
+async def bounded_fanout(fanout: int, concurrency: int, one):
+    # Acquire a slot before creating each task so only `concurrency` tasks
+    # (and their frames/contexts) exist at once, rather than all `fanout`.
+    sem = asyncio.Semaphore(concurrency)
+    release = lambda _: sem.release()
+    async with asyncio.TaskGroup() as tg:
+        for i in range(fanout):
+            await sem.acquire()
+            tg.create_task(one(i)).add_done_callback(release)
+
+def traced_async(name: str, agent_id: str | None = None, kind: str | None = None):
+    # Run the decorated coroutine inside its own current span. Cheaper than a
+    # `with start_as_current_span(...)` block in the body. A static agent_id/kind
+    # is built into the span's start attributes once (so samplers see it); the
+    # function adds call-specific attributes itself via trace.get_current_span().
+    static_attrs = _attrs(agent_id, kind) if agent_id else None
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            span = tracer.start_span(name, attributes=static_attrs)
+            token = context.attach(trace.set_span_in_context(span))
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                # Exception text has no size bound (it may echo a response body)
+                msg = _safe_attr(str(e))
+                span.record_exception(e, attributes={"exception.message": msg})
+                span.set_status(Status(StatusCode.ERROR, f"{type(e).__name__}: {msg}"))
+                raise
+            finally:
+                context.detach(token)
+                span.end()
+        return wrapper
+    return deco
+
+# Scenarios issue many calls with identical knobs; encode each query string once.
+@functools.lru_cache(maxsize=1024)
+def _tool_query(delay_ms: int, error_rate: float, payload_size_kb: int, stream: bool) -> str:
+    params = {"delay_ms": delay_ms, "error_rate": error_rate, "payload_size_kb": payload_size_kb}
+    if stream:
+        params["stream"] = 1
+    return urllib.parse.urlencode(params)
+
+@traced_async("tool_call")
+async def call_tool(tool: str, delay_ms: int, error_rate: float, attempt: int, stream: bool = False, payload_size_kb: int = 0, agent_id: str | None = None, extra_attrs: dict | None = None):
+    # One span per unit of work: callers pass their worker identity/attributes
+    # here instead of wrapping the call in their own span.
+    span = trace.get_current_span()
+    # Attributes are only built for spans that will actually be exported
+    if span.is_recording():
+        span.set_attributes(_attrs(
+            agent_id=agent_id or f"worker:{tool}",
+            kind="tool_call",
+            **{
+                "ati.tool.name": tool,
+                "ati.retry.attempt": attempt,
+                "ati.tool.delay_ms": delay_ms,
+                "ati.tool.error_rate": error_rate,
+                "ati.tool.stream": int(stream),
+                "ati.tool.payload_kb": payload_size_kb,
+            },
+            **(extra_attrs or {}),
+        ))
+    url = f"{TOOL_BASE}/tool/{tool}?{_tool_query(delay_ms, error_rate, payload_size_kb, stream)}"
+    if stream or payload_size_kb > 0:
+        # Read the body as it arrives to create real backpressure + long-lived IO.
+        # Raw bytes are only counted: no buffering, decoding or line splitting.
+        received = 0
+        async with CLIENT.stream("GET", url) as r:
             r.raise_for_status()
-            # Read some bytes to create real backpressure + long-lived IO
-            async for _ in r.aiter_lines():
-                pass
-            return {"ok": True, "stream": True}
-        r = await client.get(f"{TOOL_BASE}/tool/{tool}", params=params, timeout=30.0)
-        r.raise_for_status()
-        return r.json()
+            async for chunk in r.aiter_raw(65536):
+                received += len(chunk)
+        return {"ok": True, "stream": stream, "payload_bytes": received}
+    r = await CLIENT.get(url)
+    r.raise_for_status()
+    return r.json()
 
+@traced_async("checkpoint")
 async def checkpoint_write(size_kb: int, agent_id: str):
     # Simulate checkpoints as time + payload size (no real payload storage needed)
-    with tracer.start_as_current_span("checkpoint", attributes=_attrs(
-        agent_id=agent_id,
-        kind="checkpoint",
-        **{"ati.checkpoint.size_kb": size_kb},
-    )):
-        await asyncio.sleep(min(0.5, (size_kb / 1024.0) * 0.2))
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes(_attrs(
+            agent_id=agent_id,
+            kind="checkpoint",
+            **{"ati.checkpoint.size_kb": size_kb},
+        ))
+    await asyncio.sleep(min(0.5, (size_kb / 1024.0) * 0.2))
 
+@traced_async("planner", "planner:v1", "planner")
 async def scenario_fanout(concurrency: int, fanout: int, delay_ms: int):
-    with tracer.start_as_current_span("planner", attributes=_attrs("planner:v1", "planner", **{
-        "ati.fanout": fanout,
-        "ati.concurrency": concurrency,
-    })):
-        sem = asyncio.Semaphore(concurrency)
-        async with httpx.AsyncClient() as client:
-            async def one(i: int):
-                async with sem:
-                    with tracer.start_as_current_span("worker", attributes=_attrs(
-                        agent_id=f"worker:{i}",
-                        kind="worker",
-                        **{"ati.worker.index": i}
-                    )):
-                        return await call_tool(client, tool=f"t{i%5}", delay_ms=delay_ms, error_rate=0.0, attempt=0)
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({
+            "ati.fanout": fanout,
+            "ati.concurrency": concurrency,
+        })
+    async def one(i: int):
+        return await call_tool(tool=f"t{i%5}", delay_ms=delay_ms, error_rate=0.0, attempt=0,
+                               agent_id=f"worker:{i}", extra_attrs={"ati.worker.index": i})
 
-            tasks = [asyncio.create_task(one(i)) for i in range(fanout)]
-            await asyncio.gather(*tasks)
-        await checkpoint_write(size_kb=128, agent_id="planner:v1")
+    await bounded_fanout(fanout, concurrency, one)
+    await checkpoint_write(size_kb=128, agent_id="planner:v1")
 
+@traced_async("planner", "planner:v1", "planner")
 async def scenario_blocking_chain(depth: int, delay_ms: int):
-    with tracer.start_as_current_span("planner", attributes=_attrs("planner:v1", "planner", **{"ati.chain.depth": depth})):
-        async with httpx.AsyncClient() as client:
-            for i in range(depth):
-                with tracer.start_as_current_span("step", attributes=_attrs(
-                    agent_id=f"chain:{i}",
-                    kind="worker",
-                    **{"ati.chain.index": i}
-                )):
-                    await call_tool(client, tool="chain", delay_ms=delay_ms, error_rate=0.0, attempt=0)
-        await checkpoint_write(size_kb=64, agent_id="planner:v1")
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({"ati.chain.depth": depth})
+    for i in range(depth):
+        await call_tool(tool="chain", delay_ms=delay_ms, error_rate=0.0, attempt=0,
+                        agent_id=f"chain:{i}", extra_attrs={"ati.chain.index": i})
+    await checkpoint_write(size_kb=64, agent_id="planner:v1")
 
+@traced_async("planner", "planner:v1", "planner")
 async def scenario_retry_storm(fanout: int, concurrency: int, delay_ms: int, error_rate: float, max_retries: int):
-    with tracer.start_as_current_span("planner", attributes=_attrs("planner:v1", "planner", **{
-        "ati.fanout": fanout,
-        "ati.concurrency": concurrency,
-        "ati.retry.max": max_retries,
-    })):
-        sem = asyncio.Semaphore(concurrency)
-        async with httpx.AsyncClient() as client:
-            async def one(i: int):
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({
+            "ati.fanout": fanout,
+            "ati.concurrency": concurrency,
+            "ati.retry.max": max_retries,
+        })
+    # The slot is only held for the call itself, so a worker sleeping off a
+    # backoff doesn't block healthy workers from making progress.
+    sem = asyncio.Semaphore(concurrency)
+    async def one(i: int):
+        tool = f"r{i%5}"
+        backoff = 0.02
+        for attempt in range(max_retries + 1):
+            try:
                 async with sem:
-                    tool = f"r{i%5}"
-                    attempt = 0
-                    backoff = 0.02
-                    while True:
-                        try:
-                            return await call_tool(client, tool=tool, delay_ms=delay_ms, error_rate=error_rate, attempt=attempt)
-                        except Exception:
-                            attempt += 1
-                            if attempt > max_retries:
-                                return {"ok": False}
-                            await asyncio.sleep(backoff)
-                            backoff = min(backoff * 2, 0.5)
-
-            tasks = [asyncio.create_task(one(i)) for i in range(fanout)]
-            await asyncio.gather(*tasks)
-        await checkpoint_write(size_kb=256, agent_id="planner:v1")
+                    return await call_tool(tool=tool, delay_ms=delay_ms, error_rate=error_rate, attempt=attempt)
+            except (httpx.HTTPError, asyncio.TimeoutError):
+                if attempt == max_retries:
+                    return {"ok": False}
+                # Decorrelated jitter keeps workers that failed together from retrying in
+                # lockstep; drawn before sleeping so the first retry wave is spread too
+                backoff = min(0.5, _rng.uniform(0.02, backoff * 3))
+                await asyncio.sleep(backoff)
+
+    # Let every worker finish; surface unexpected errors only once they have
+    results = await asyncio.gather(*[one(i) for i in range(fanout)], return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    await checkpoint_write(size_kb=256, agent_id="planner:v1")
 
+@traced_async("planner", "planner:v1", "planner")
 async def scenario_dag(fanout: int, delay_ms: int):
     # Diamond pattern: Planner -> workers (parallel) -> aggregator (single)
-    with tracer.start_as_current_span("planner", attributes=_attrs("planner:v1", "planner", **{"ati.dag.fanout": fanout})):
-        async with httpx.AsyncClient() as client:
-            # Fork
-            results = []
-            async def branch(i: int):
-                with tracer.start_as_current_span("branch_worker", attributes=_attrs(
-                    agent_id=f"branch:{i}",
-                    kind="worker",
-                )):
-                   return await call_tool(client, tool=f"dag_{i}", delay_ms=delay_ms, error_rate=0.0, attempt=0)
-
-            results = await asyncio.gather(*[branch(i) for i in range(fanout)])
-            
-            # Join/Aggregate
-            with tracer.start_as_current_span("aggregator", attributes=_attrs("aggregator:v1", "worker")):
-                 await call_tool(client, tool="aggregator", delay_ms=delay_ms, error_rate=0.0, attempt=0)
-        
-        await checkpoint_write(size_kb=64, agent_id="planner:v1")
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({"ati.dag.fanout": fanout})
+    async def aggregate(ready: int):
+        await call_tool(tool="aggregator", delay_ms=delay_ms, error_rate=0.0, attempt=0,
+                        agent_id="aggregator:v1", extra_attrs={"ati.dag.ready_branches": ready})
+
+    # Fork, then start the aggregator once half the branches are in, so its own
+    # latency overlaps the slowest branches instead of following them. The task
+    # group joins everything (and cancels the rest if any branch fails).
+    async with asyncio.TaskGroup() as tg:
+        branches = [
+            tg.create_task(call_tool(tool=f"dag_{i}", delay_ms=delay_ms, error_rate=0.0, attempt=0,
+                                     agent_id=f"branch:{i}"))
+            for i in range(fanout)
+        ]
+        aggregator = None
+        for done, fut in enumerate(asyncio.as_completed(branches), 1):
+            await fut
+            if aggregator is None and done * 2 >= fanout:
+                aggregator = tg.create_task(aggregate(done))
+        if aggregator is None:
+            tg.create_task(aggregate(0))
+
+    await checkpoint_write(size_kb=64, agent_id="planner:v1")
 
+_THOUGHT_TMPL = "Thought {0}: Analysis of previous step... Plan: Execute step_{0}..."
+
+@traced_async("agent_core", "agent:v1", "planner")
 async def scenario_react(max_steps: int, delay_ms: int):
     # ReAct: Thought -> Act -> Observe -> Repeat
-    with tracer.start_as_current_span("agent_core", attributes=_attrs("agent:v1", "planner", **{"ati.react.max_steps": max_steps})):
-        async with httpx.AsyncClient() as client:
-            for i in range(max_steps):
-                # Thought
-                with tracer.start_as_current_span("thought", attributes=_attrs(f"thought:{i}", "internal", **{"ati.step": i})):
-                    # Simulate verbose logging of "LLM reasoning"
-                    reasoning_trace = f"Thought {i}: Analysis of previous step... Plan: Execute step_{i}..."
-                    trace.get_current_span().set_attribute("ati.llm.prompt", reasoning_trace)
-                    await asyncio.sleep(0.01 + random.random() * 0.05)
-                
-                # Act (Tool Call)
-                with tracer.start_as_current_span("act", attributes=_attrs(f"act:{i}", "tool_call", **{"ati.step": i})):
-                     await call_tool(client, tool=f"step_{i}", delay_ms=delay_ms, error_rate=0.0, attempt=0)
-                
-                # Observe (simulated by logic)
-                if random.random() < 0.1: # 10% chance to finish early
-                    break
-                    
-        await checkpoint_write(size_kb=128, agent_id="agent:v1")
+    core = trace.get_current_span()
+    if core.is_recording():
+        core.set_attributes({"ati.react.max_steps": max_steps})
+    for i in range(max_steps):
+        # Thought
+        span = tracer.start_span("thought")
+        with trace.use_span(span, end_on_exit=True):
+            # Simulate verbose logging of "LLM reasoning" (only built if the span is kept)
+            if span.is_recording():
+                span.set_attributes(_attrs(f"thought:{i}", "internal", **{
+                    "ati.step": i,
+                    "ati.llm.prompt": _THOUGHT_TMPL.format(i),
+                }))
+            await asyncio.sleep(0.01 + _rng.random() * 0.05)
+
+        # Act (Tool Call)
+        await call_tool(tool=f"step_{i}", delay_ms=delay_ms, error_rate=0.0, attempt=0,
+                        agent_id=f"act:{i}", extra_attrs={"ati.step": i})
+
+        # Observe (simulated by logic)
+        if _rng.random() < 0.1: # 10% chance to finish early
+            break
+
+    await checkpoint_write(size_kb=128, agent_id="agent:v1")
 
+@traced_async("planner", "planner:v1", "planner")
 async def scenario_human(delay_s: float):
     # Human in the loop: Planner -> Wait -> Resume
-    with tracer.start_as_current_span("planner", attributes=_attrs("planner:v1", "planner", **{"ati.human.delay_s": delay_s})):
-        # Phase 1: Pre-human
-        async with httpx.AsyncClient() as client:
-             await call_tool(client, tool="pre_human", delay_ms=100, error_rate=0.0, attempt=0)
-             
-        # Human step (simulated long wait)
-        with tracer.start_as_current_span("human_feedback", attributes=_attrs("human", "interactive")):
-            await asyncio.sleep(delay_s)
-            
-        # Phase 2: Post-human
-        async with httpx.AsyncClient() as client:
-             await call_tool(client, tool="post_human", delay_ms=100, error_rate=0.0, attempt=0)
+    # NaN never orders in the shared heap and would stall every other wait
+    if not (math.isfinite(delay_s) and delay_s >= 0):
+        raise HTTPException(400, "human_delay_s must be a finite, non-negative number")
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({"ati.human.delay_s": delay_s})
+    # Phase 1: Pre-human
+    await call_tool(tool="pre_human", delay_ms=100, error_rate=0.0, attempt=0)
 
+    # Human step (simulated long wait): hand it to the scheduler instead of
+    # holding this request open. Phase 2 runs from _resume_human.
+    pending_id = uuid.uuid4().hex
+    resume_at = asyncio.get_running_loop().time() + delay_s
+    feedback = tracer.start_span("human_feedback", attributes=_attrs("human", "interactive"))
+    _PENDING_HUMANS[pending_id] = {"status": "waiting", "resume_at": resume_at}
+    await _HUMAN_QUEUE.put((resume_at, pending_id, context.get_current(), feedback))
+    return pending_id
+
+async def _human_scheduler():
+    # A single task owns every pending wait, ordered by resume time, rather
+    # than one request coroutine sleeping per human.
+    loop = asyncio.get_running_loop()
+    while True:
+        # Never let one bad entry kill the only task that resumes waits
+        try:
+            await _schedule_due_humans(loop)
+        except Exception:
+            logger.exception("human scheduler step failed")
+
+async def _schedule_due_humans(loop: asyncio.AbstractEventLoop):
+    timeout = max(0.0, _HUMAN_WAITS[0][0] - loop.time()) if _HUMAN_WAITS else None
+    try:
+        heapq.heappush(_HUMAN_WAITS, await asyncio.wait_for(_HUMAN_QUEUE.get(), timeout))
+    except asyncio.TimeoutError:
+        pass
+    now = loop.time()
+    while _HUMAN_WAITS and _HUMAN_WAITS[0][0] <= now:
+        _, pending_id, ctx, feedback = heapq.heappop(_HUMAN_WAITS)
+        feedback.end()
+        task = asyncio.create_task(_resume_human(pending_id, ctx))
+        _RESUME_TASKS.add(task)
+        task.add_done_callback(_RESUME_TASKS.discard)
+
+async def _resume_human(pending_id: str, ctx):
+    entry = _PENDING_HUMANS[pending_id]
+    # Phase 2: Post-human, in the original workflow's trace
+    token = context.attach(ctx)
+    status = "failed"
+    try:
+        await call_tool(tool="post_human", delay_ms=100, error_rate=0.0, attempt=0)
+        status = "done"
+    except Exception:
+        pass  # already recorded on the tool_call span
+    finally:
+        entry["status"] = status
+        context.detach(token)
+        asyncio.get_running_loop().call_later(_HUMAN_RESULT_TTL_S, _PENDING_HUMANS.pop, pending_id, None)
+
+async def _stop_human_scheduler(scheduler: asyncio.Task):
+    scheduler.cancel()
+    for task in _RESUME_TASKS:
+        task.cancel()
+    await asyncio.gather(scheduler, *_RESUME_TASKS, return_exceptions=True)
+    # Waits that never resumed still own an open human_feedback span
+    while not _HUMAN_QUEUE.empty():
+        _HUMAN_WAITS.append(_HUMAN_QUEUE.get_nowait())
+    for _, _, _, feedback in _HUMAN_WAITS:
+        feedback.set_status(Status(StatusCode.ERROR, "shutdown before resume"))
+        feedback.end()
+    _HUMAN_WAITS.clear()
+    for entry in _PENDING_HUMANS.values():
+        if entry["status"] == "waiting":
+            entry["status"] = "failed"
+
+@traced_async("planner", "planner:v1", "planner")
 async def scenario_rag(chunk_count: int, chunk_size_kb: int, delay_ms: int):
     # RAG: Planner -> Retrieval (Large Payload) -> Generation
-    with tracer.start_as_current_span("planner", attributes=_attrs("planner:v1", "planner", **{"ati.rag.chunks": chunk_count})):
-        async with httpx.AsyncClient() as client:
-             # Retrieval with massive payload
-             total_kb = chunk_count * chunk_size_kb
-             with tracer.start_as_current_span("retrieval", attributes=_attrs("retriever", "tool_call", **{"ati.rag.total_kb": total_kb})):
-                 result = await call_tool(client, tool="vector_db", delay_ms=delay_ms, error_rate=0.0, attempt=0, payload_size_kb=total_kb)
-                 
-                 # BAD PRACTICE: Log the entire huge payload to the span attributes!
-                 if isinstance(result, dict) and "payload" in result:
-                     trace.get_current_span().set_attribute("ati.rag.content", result["payload"])
-                 
-             # Simulated generation processing
-             with tracer.start_as_current_span("generation", attributes=_attrs("llm", "generation")):
-                 await asyncio.sleep(0.1 + (total_kb / 5000.0)) # sleep proprotional to size
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({"ati.rag.chunks": chunk_count})
+    # Retrieval with massive payload
+    total_kb = chunk_count * chunk_size_kb
+    with tracer.start_as_current_span("retrieval", attributes=_attrs("retriever", "tool_call", **{"ati.rag.total_kb": total_kb})):
+        result = await call_tool(tool="vector_db", delay_ms=delay_ms, error_rate=0.0, attempt=0, payload_size_kb=total_kb)
+
+        # Record how much was retrieved rather than logging the payload on the span.
+        if isinstance(result, dict) and "payload_bytes" in result:
+            trace.get_current_span().set_attribute("ati.rag.content_bytes", result["payload_bytes"])
+
+    # Simulated generation processing
+    with tracer.start_as_current_span("generation", attributes=_attrs("llm", "generation")):
+        await asyncio.sleep(0.1 + (total_kb / 5000.0)) # sleep proprotional to size
 
 @app.get("/run")
 async def run(
@@ -239,13 +460,33 @@ async def run(
         elif scenario == "react":
             await scenario_react(max_steps=max_steps, delay_ms=delay_ms)
         elif scenario == "human":
-            await scenario_human(delay_s=human_delay_s)
+            pending_id = await scenario_human(delay_s=human_delay_s)
+            return JSONResponse(status_code=202, content={
+                "ok": True,
+                "scenario": scenario,
+                "elapsed_s": round(time.time() - start, 3),
+                "pending_id": pending_id,
+                "poll": f"/resume/{pending_id}",
+            })
         elif scenario == "rag":
             await scenario_rag(chunk_count=rag_chunks, chunk_size_kb=rag_chunk_size_kb, delay_ms=delay_ms)
         else:
             raise HTTPException(400, "unknown scenario")
     return {"ok": True, "scenario": scenario, "elapsed_s": round(time.time() - start, 3)}
 
+@app.get("/resume/{pending_id}")
+async def resume(pending_id: str):
+    entry = _PENDING_HUMANS.get(pending_id)
+    if entry is None:
+        raise HTTPException(404, "unknown pending_id")
+    if entry["status"] == "waiting":
+        return JSONResponse(status_code=202, content={
+            "ok": True,
+            "status": "waiting",
+            "resume_in_s": round(max(0.0, entry["resume_at"] - asyncio.get_running_loop().time()), 3),
+        })
+    return {"ok": entry["status"] == "done", "status": entry["status"]}
+
 @app.get("/stream")
 async def stream(duration_s: int = 20, tool_delay_ms: int = 400, background_fanout: int = 50):
     """
@@ -262,9 +503,9 @@ async def stream(duration_s: int = 20, tool_delay_ms: int = 400, background_fano
             t0 = time.time()
             i = 0
             while time.time() - t0 < duration_s:
-                # emit "tokens"
-                yield f"token {i}\n"
+                # emit "tokens" as bytes so Starlette doesn't have to encode each one
+                yield b"token %d\n" % i
                 i += 1
                 await asyncio.sleep(0.05)
             await bg_task
-    return StreamingResponse(gen(), media_type="text/plain")
+    return StreamingResponse(gen(), media_type="text/plain; charset=utf-8")
@@ -16,10 +16,31 @@ function run_scenario() {
     
     echo -e "${BLUE}Running $target_name...${NC}"
     echo "URL: $base_url$scenario_path"
-    curl -s "$base_url$scenario_path"
+    if [[ "$scenario_path" == *"scenario=human"* ]]; then
+        local resp
+        resp=$(curl -s "$base_url$scenario_path")
+        echo "$resp"
+        poll_pending "$base_url" "$resp"
+    else
+        curl -s "$base_url$scenario_path"
+    fi
     echo -e "\n${GREEN}Done!${NC}"
 }
 
+# The human scenario returns a pending_id and finishes in the background;
+# poll /resume/{id} until the post-human step has run.
+function poll_pending() {
+    local base_url=$1
+    local poll
+    poll=$(echo "$2" | sed -n 's/.*"poll":"\([^"]*\)".*/\1/p')
+    [ -z "$poll" ] && return
+    echo "Polling $base_url$poll ..."
+    while [ "$(curl -s -o /dev/null -w '%{http_code}' "$base_url$poll")" == "202" ]; do
+        sleep 0.5
+    done
+    curl -s "$base_url$poll"
+}
+
 while true; do
     echo "=========================================="
     echo "Interactive Agent Scenario Generator"
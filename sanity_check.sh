@@ -14,7 +14,16 @@ curl -s "http://localhost:8080/run?scenario=dag&fanout=20&delay_ms=40"
 echo "Agent app ReAct scenario..."
 curl -s "http://localhost:8080/run?scenario=react&max_steps=5&delay_ms=50"
 echo "Agent app Human scenario..."
-curl -s "http://localhost:8080/run?scenario=human&human_delay_s=2.0"
+resp=$(curl -s "http://localhost:8080/run?scenario=human&human_delay_s=2.0")
+echo "$resp"
+# The wait is held server-side; poll until the post-human step has run
+poll=$(echo "$resp" | sed -n 's/.*"poll":"\([^"]*\)".*/\1/p')
+if [ -n "$poll" ]; then
+    while [ "$(curl -s -o /dev/null -w '%{http_code}' "http://localhost:8080$poll")" == "202" ]; do
+        sleep 0.5
+    done
+    curl -s "http://localhost:8080$poll"
+fi
 echo "Agent app RAG scenario..."
 curl -s "http://localhost:8080/run?scenario=rag&rag_chunks=10&rag_chunk_size_kb=2&delay_ms=30"
 echo "All checks passed!"
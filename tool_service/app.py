@@ -1,30 +1,72 @@
 import asyncio
+import math
 import os
 import random
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from functools import lru_cache
 
-app = FastAPI()
+import orjson
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 DEFAULT_DELAY_MS = int(os.getenv("TOOL_DELAY_MS", "80"))
 DEFAULT_ERROR_RATE = float(os.getenv("TOOL_ERROR_RATE", "0.0"))
 
+# Private RNG (seeded from os.urandom) rather than the shared module-level one
+_rng = random.Random()
+
+# Large payloads are streamed as slices of one preallocated chunk.
+_CHUNK = b"a" * 65536
+
+# Requests whose deadlines fall in the same slot share a single loop timer, so a
+# burst of N calls schedules a handful of timers instead of N. Deadlines are
+# rounded up, so nobody wakes early and nobody waits more than one slot extra.
+_SLEEP_SLOT_S = 0.001
+_wakeups: dict[int, asyncio.Event] = {}
+
+def _wake(slot: int):
+    _wakeups.pop(slot).set()
+
+async def _grouped_sleep(seconds: float):
+    loop = asyncio.get_running_loop()
+    slot = math.ceil((loop.time() + seconds) / _SLEEP_SLOT_S)
+    event = _wakeups.get(slot)
+    if event is None:
+        event = _wakeups[slot] = asyncio.Event()
+        loop.call_at(slot * _SLEEP_SLOT_S, _wake, slot)
+    await event.wait()
+
+# Plain tool responses only vary by tool name and delay; encode each combination once.
+@lru_cache(maxsize=4096)
+def _cached_body(tool_name: str, delay_ms: int) -> bytes:
+    return orjson.dumps({"tool": tool_name, "delay_ms": delay_ms, "ok": True})
+
+async def _payload_chunks(total: int):
+    full, rest = divmod(total, len(_CHUNK))
+    for _ in range(full):
+        yield _CHUNK
+    if rest:
+        yield _CHUNK[:rest]
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 @app.get("/tool/{tool_name}")
-async def tool_call(
-    tool_name: str, 
-    delay_ms: int | None = None, 
-    error_rate: float | None = None, 
-    stream: int = 0,
-    payload_size_kb: int = 0
-):
-    d = DEFAULT_DELAY_MS if delay_ms is None else delay_ms
-    e = DEFAULT_ERROR_RATE if error_rate is None else error_rate
-
-    if random.random() < e:
+async def tool_call(tool_name: str, request: Request):
+    # Query params: delay_ms, error_rate, stream, payload_size_kb. Parsed by hand
+    # so the hot path skips FastAPI's per-field Pydantic validation.
+    qp = request.query_params
+    try:
+        d = int(qp.get("delay_ms") or DEFAULT_DELAY_MS)
+        e = float(qp.get("error_rate") or DEFAULT_ERROR_RATE)
+        stream = int(qp.get("stream") or 0)
+        payload_size_kb = int(qp.get("payload_size_kb") or 0)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    if _rng.random() < e:
         raise HTTPException(status_code=503, detail=f"{tool_name} unavailable")
 
     if stream == 1:
@@ -33,16 +75,14 @@ async def tool_call(
             chunks = 50
             per = max(d / chunks, 1)
             for i in range(chunks):
-                await asyncio.sleep(per / 1000.0)
+                await _grouped_sleep(per / 1000.0)
                 yield f"chunk {i} from {tool_name}\n"
         return StreamingResponse(gen(), media_type="text/plain")
 
-    await asyncio.sleep(d / 1000.0)
-    
-    response = {"tool": tool_name, "delay_ms": d, "ok": True}
+    await _grouped_sleep(d / 1000.0)
+
     if payload_size_kb > 0:
-        # Generate dummy payload roughly size_kb
-        # 1KB = 1024 chars roughly
-        response["payload"] = "a" * (payload_size_kb * 1024)
-        
-    return response
+        # Dummy payload of exactly size_kb, never materialized as one string
+        return StreamingResponse(_payload_chunks(payload_size_kb * 1024), media_type="application/octet-stream")
+
+    return Response(_cached_body(tool_name, d), media_type="application/json")